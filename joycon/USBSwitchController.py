@@ -7,12 +7,59 @@
 
 import sys
 import array
+import errno
 import time
 import struct
+import logging
 
 import usb.core
 import usb.util
 
+log = logging.getLogger(__name__)
+
+# USB-HID commands handled by the charging grip / pro controller STM32.
+# 0x80 = vendor commands for managing the JoyCon or JoyCon-section
+# these commands result in downstream UART commands to the joycons
+_COMMAND_DEVICE_INFO         = b'\x80\x01'
+_COMMAND_UART_PAIR           = b'\x80\x02'
+_COMMAND_RESTRICT_TO_HID     = b'\x80\x04'
+_COMMAND_SEND_UART_COMMAND   = b'\x80\x92'
+
+# 0x82 = vendor commands for managing the grip or pro controller
+# these commands shouldn't result in any uart-to-joycon communications
+_COMMAND_ENTER_DFU           = b'\x82\x01'  # Note: erases grip STM32
+_COMMAND_RESET               = b'\x82\x02'
+
+# Rumble data that leads each bluetooth command; leaves the rumble motors idle.
+_RUMBLE_NEUTRAL = b'\x00\x00\x01\x40\x40\x00\x01\x40\x40'
+
+# Layout of a UART command wrapped for the grip: the USB-HID command, and then the UART
+# header (UART command, payload length, three reserved bytes). The payload follows directly.
+_UART_PACKET_HEADER = struct.Struct("<2sBHBBB")
+
+# Layout of a bluetooth command wrapped for the grip: the UART packet header above, and then
+# the bluetooth command, rumble data and subcommand that lead the bluetooth packet.
+# The argument follows directly.
+_BLUETOOTH_PACKET_HEADER = struct.Struct("<2sBHBBBB9sB")
+
+# Layout of the device info report: the JoyCon type, and its 48-bit MAC split into a
+# low 32-bit and a high 16-bit half.
+_DEVICE_INFO = struct.Struct("<BIH")
+
+# The report usb_read returns when no report arrives before its timeout.
+_EMPTY_REPORT = memoryview(b'')
+
+# The attribute we store each endpoint in, by the endpoint's direction.
+_ENDPOINT_ATTRIBUTES = {
+    usb.util.ENDPOINT_IN:  'endpoint_in',
+    usb.util.ENDPOINT_OUT: 'endpoint_out',
+}
+
+# Endpoints we've already found, keyed by (bus, address, VID, PID, interface number, bulk preference),
+# so we don't need to walk the configuration descriptor again for each interface or connection to a
+# device. The VID and PID guard against a recycled address now belonging to a different device.
+_ENDPOINT_CACHE = {}
+
 class USBSwitchController:
     """
     Class representing a USB connection to a Switch controller; i.e. a connection 
@@ -20,17 +67,13 @@ class USBSwitchController:
     """
 
     # USB-HID commands handled by the charging grip / pro controller STM32.
-    # 0x80 = vendor commands for managing the JoyCon or JoyCon-section
-    # these commands result in downstream UART commands to the joycons
-    COMMAND_DEVICE_INFO         = [0x80, 0x01]
-    COMMAND_UART_PAIR           = [0x80, 0x02]
-    COMMAND_RESTRICT_TO_HID     = [0x80, 0x04]
-    COMMAND_SEND_UART_COMMAND   = [0x80, 0x92]
-
-    # 0x82 = vendor commands for managing the grip or pro controller
-    # these commands shouldn't result in any uart-to-joycon communications
-    COMMAND_ENTER_DFU           = [0x82, 0x01]  # Note: erases grip STM32
-    COMMAND_RESET               = [0x82, 0x02]
+    # Kept as lists for compatibility; internally, we use the module-level bytes constants.
+    COMMAND_DEVICE_INFO         = list(_COMMAND_DEVICE_INFO)
+    COMMAND_UART_PAIR           = list(_COMMAND_UART_PAIR)
+    COMMAND_RESTRICT_TO_HID     = list(_COMMAND_RESTRICT_TO_HID)
+    COMMAND_SEND_UART_COMMAND   = list(_COMMAND_SEND_UART_COMMAND)
+    COMMAND_ENTER_DFU           = list(_COMMAND_ENTER_DFU)  # Note: erases grip STM32
+    COMMAND_RESET               = list(_COMMAND_RESET)
 
 
     # UART commands: are there more of these than this?
@@ -45,13 +88,20 @@ class USBSwitchController:
 
     USB_BUF_LEN = 64
 
-    def __init__(self, interface=0, wait_for_device=True):
+    # How long we'll wait, in seconds, for a response to a command before re-issuing it;
+    # and how many unrelated reports we'll accept before re-issuing it regardless.
+    COMMAND_RESEND_INTERVAL       = 0.2
+    COMMAND_RESEND_MISMATCH_LIMIT = 8
+
+    def __init__(self, interface=0, wait_for_device=True, prefer_bulk=True):
         """
         Sets up a new Charging Grip/Pro Controller connection.
 
         interface -- The interface number to use for our connection. For the charging grip,
             two interfaces are present that represent the two joycons.
         wait_for_device -- Iff this is set, will block until a device is found.
+        prefer_bulk -- Iff this is set, bulk endpoints will be used in place of interrupt
+            endpoints wherever the interface provides them.
         """
 
         # By default, don't ever issue any DFU commands.
@@ -64,42 +114,72 @@ class USBSwitchController:
         self.connect_to_device(*self.device_id, wait_for_device=wait_for_device)
 
         # Store which endpoint we're working with.
-        self._determine_endpoints(interface)
+        self._determine_endpoints(interface, prefer_bulk)
         if (self.endpoint_in is None) or (self.endpoint_out is None):
             raise IOError("Could not connect to the JoyCon with the given interface number.")
 
         # Ensure we control the JoyCon, rather than the linux hid subsystem.
         self.detach_kernel_driver(interface)
 
+        # Buffers we assemble outgoing packets in and read incoming reports into, so we don't
+        # allocate new ones per command. PyUSB passes array.array objects straight through to
+        # libusb, but has to convert anything else element-by-element, so we use arrays for both.
+        self._tx_buf  = array.array('B', bytes(self.USB_BUF_LEN))
+        self._tx_view = memoryview(self._tx_buf)
+        self._rx_buf  = array.array('B', bytes(self.USB_BUF_LEN))
+        self._rx_view = memoryview(self._rx_buf)
+
+        # The expected response headers of commands that have been posted but not yet awaited,
+        # mapped to their response lengths; and any of their responses that arrived early.
+        self._outstanding     = {}
+        self._early_responses = {}
+
 
-    def _determine_endpoints(self, interface_number):
+    def _determine_endpoints(self, interface_number, prefer_bulk=True):
         """
         Determines the endpoint that should be used to communicate with the given
         interface.
 
         interface_number -- The number of the interface whose endpoint should be queried.
+        prefer_bulk -- Iff this is set, bulk endpoints will be chosen over interrupt endpoints.
         """
         self.endpoint_in = None
         self.endpoint_out = None
 
+        # If we've already looked up this interface's endpoints, re-use them.
+        cache_key = (self.dev.bus, self.dev.address, self.dev.idVendor, self.dev.idProduct,
+                interface_number, prefer_bulk)
+        if cache_key in _ENDPOINT_CACHE:
+            self.endpoint_in, self.endpoint_out = _ENDPOINT_CACHE[cache_key]
+            return
+
         # Grab the configuration object for the active device...
         conf = self.dev.get_active_configuration()
 
-        # Search for an intrface that matches our interface number.
-        for interface in conf.interfaces():
+        # Find the interface that matches our interface number...
+        interface = usb.util.find_descriptor(conf, bInterfaceNumber=interface_number)
+        if interface is None:
+            return
+
+        # ... and populate our information from its endpoints in each direction.
+        for direction, attribute in _ENDPOINT_ATTRIBUTES.items():
+            endpoints = list(usb.util.find_descriptor(interface, find_all=True, custom_match=lambda endpoint: \
+                    usb.util.endpoint_direction(endpoint.bEndpointAddress) == direction))
 
-            # If this doesn't describe the interface we're looking for, skip it.
-            if interface.bInterfaceNumber != interface_number:
+            if not endpoints:
                 continue
 
-            # Populate our information from each endpoint.
-            for endpoint in interface.endpoints():
+            # Use the first endpoint, unless we'd rather have a bulk endpoint and one exists.
+            endpoint = endpoints[0]
+            if prefer_bulk:
+                endpoint = next((candidate for candidate in endpoints if \
+                        usb.util.endpoint_type(candidate.bmAttributes) == usb.util.ENDPOINT_TYPE_BULK), endpoint)
 
-                # Set the address of our internal endpoints according to the endpoint's address.
-                if endpoint.bEndpointAddress & usb.util.ENDPOINT_IN:
-                    self.endpoint_in = endpoint.bEndpointAddress
-                else:
-                    self.endpoint_out = endpoint.bEndpointAddress
+            setattr(self, attribute, endpoint.bEndpointAddress)
+
+        # Only remember complete results, so a failed lookup is retried next time.
+        if (self.endpoint_in is not None) and (self.endpoint_out is not None):
+            _ENDPOINT_CACHE[cache_key] = (self.endpoint_in, self.endpoint_out)
 
 
     def detach_kernel_driver(self, interface):
@@ -120,16 +200,17 @@ class USBSwitchController:
         wait_for_device -- True iff we should block until a device is found.
         inter_connection_delay -- The delay, in seconds, betwen connection attempts.
         """
-        s.dev = None
+        s.dev = usb.core.find(idVendor=vid, idProduct=pid)
 
+        # If the device isn't present yet, poll for it until it is.
         while s.dev is None:
-            s.dev = usb.core.find(idVendor=vid, idProduct=pid)
 
             # If we're not waiting for the device, fail out immediately.
             if not wait_for_device:
                 raise IOError("Controller not found!")
 
             time.sleep(inter_connection_delay)
+            s.dev = usb.core.find(idVendor=vid, idProduct=pid)
 
 
     def usb_write(self, packet):
@@ -145,22 +226,46 @@ class USBSwitchController:
         """
         Reads a raw report from the JoyCon.
 
-        length -- The number of bytes to be read.
+        length -- The maximum number of bytes of the report to return.
+        timeout -- Command timeout, in milliseconds.
+
+        returns The report; or an empty bytes object if no report arrives before the timeout.
+        """
+        return bytes(self._usb_read(length, timeout))
+
+
+    def _usb_read(self, length=None, timeout=200):
+        """
+        Reads a raw report from the JoyCon, without copying it out of our receive buffer.
+
+        length -- The maximum number of bytes of the report to return.
         timeout -- Command timeout, in milliseconds.
+
+        returns A memoryview of the report, which is only valid until the next read;
+            or an empty memoryview if no report arrives before the timeout.
         """
 
         # If no length was specified, assume the maximum.
         if length is None:
             length = self.USB_BUF_LEN
 
-        # FIXME: do we want to return empty packets on failure?
+        # Always read a full packet into our receive buffer; the device sends whole reports.
         try:
-            return self.dev.read(self.endpoint_in, length, timeout)
-        except usb.core.USBError:
-            return array.array('B', [0] * length)
+            read_length = self.dev.read(self.endpoint_in, self._rx_buf, timeout)
+        except usb.core.USBError as e:
+
+            # Timeouts are routine when the JoyCon has nothing to say; anything else is a real error.
+            if e.errno != errno.ETIMEDOUT:
+                raise
+
+            return _EMPTY_REPORT
+
+        return self._rx_view[:min(read_length, length)]
 
 
     class UsbResponse:
+        __slots__ = ('cmd_type', 'cmd', 'status', 'data')
+
         def __init__(s, pkt, data_len):
             s.cmd_type = pkt[0]
             s.cmd = pkt[1]
@@ -168,68 +273,249 @@ class USBSwitchController:
             s.data = pkt[3 : 3 + data_len]
 
 
-    def send_command(self, command, response_length=USB_BUF_LEN):
+    def post_command(self, command, response_length=USB_BUF_LEN):
         """
-        Issue a command to the STM32 on the charging grip or pro controller.
-        Some commands (e.g. COMMAND_SEND_JOYCON_COMMAND) issue further commands to the JoyCon.
+        Issues a command to the STM32 on the charging grip or pro controller, without waiting
+        for its response; so several commands can be in flight at once. Each command that
+        expects a response must later be passed to await_response, so it stops being tracked.
+
+        Note that await_response re-issues its command if the response is slow to arrive; so
+        don't post a command that expects no response (and thus is never re-issued) behind one
+        that may be re-issued, if the order of the two matters to the device.
 
         command -- The command to be issued.
         response_length -- The length of the response to be read.
+
+        returns A token to be passed to await_response to collect the command's response.
         """
 
-        resp = None
+        # Responses are matched to their commands by command number, so we can't tell apart
+        # the responses to two copies of the same command in flight at once.
+        expected = (command[0] | 1, command[1])
+        if response_length != 0 and expected in self._outstanding:
+            raise ValueError("A command with the same response is already outstanding.")
 
         # Issute the raw command over USB.
         self.usb_write(command)
 
+        # If we're expecting a response, note that it's outstanding, so it can be kept if it
+        # arrives while we're waiting on another command.
+        if response_length != 0:
+            self._outstanding[expected] = response_length
+
+        return (command, response_length)
+
+
+    def await_response(self, token):
+        """
+        Waits for the response to a command issued with post_command.
+
+        token -- The token returned by post_command for the relevant command.
+
+        returns The response data.
+        """
+        data = self._await_response(token)
+        return None if data is None else bytes(data)
+
+
+    def _await_response(self, token):
+        """
+        Waits for the response to a command issued with post_command, without copying it.
+
+        token -- The token returned by post_command for the relevant command.
+
+        returns A memoryview of the response data, which is only valid until the next read.
+        """
+
+        command, response_length = token
+
         # If we're not looking for a response, don't try to read one.
         if response_length == 0: 
             return None
 
-        while True:
+        # Figure out the header of the response we're waiting for up front, so each report
+        # we read can be checked against it directly.
+        expected_cmd_type = command[0] | 1
+        expected_cmd      = command[1]
+        expected          = (expected_cmd_type, expected_cmd)
+
+        try:
+            # If our response arrived while we were waiting on another command, use it.
+            raw_response = self._early_responses.pop(expected, None)
+            if raw_response is not None:
+                return self._parse_response(memoryview(raw_response), response_length)
+
+            resend_timeout  = int(self.COMMAND_RESEND_INTERVAL * 1000)
+            last_write_time = time.monotonic()
+            mismatch_count  = 0
 
-            # FIXME: don't stall here forever on a comm error?
+            while True:
 
-            # Read and parse a response from the device.
-            raw_response = self.usb_read()
-            resp = self.UsbResponse(raw_response, response_length)
+                # FIXME: don't stall here forever on a comm error?
 
-            # Wait for us to recieve a response for the given command.
-            if resp.cmd_type == command[0] | 1 and resp.cmd == command[1]:
-                break
+                # Read a response from the device, if one arrives.
+                raw_response = self._usb_read(timeout=resend_timeout)
 
-            # app mainloop resets usb and sends empty device_id_response in case of error...
-            # need to check for that specficially and give up.
-            if (resp.cmd_type, resp.cmd) == (0x81, 0x01) and resp.status != 0:
-                return None
+                if raw_response:
 
-            # fw may respond with old data (e.g. if it's going through reset), so
-            # we simply resend cmd until a decently-related looking response comes back.
-            # fw could also be throwing us a lot of uart spew, which we want to skip.
-            self.usb_write(command)
+                    # Wait for us to recieve a response for the given command. We check the raw
+                    # header, so we don't bother parsing the reports we're going to discard.
+                    if raw_response[0] == expected_cmd_type and raw_response[1] == expected_cmd:
+                        break
 
+                    # If this is the response to another outstanding command, keep a copy of it
+                    # for when that command is awaited.
+                    stashed = False
+                    if self._outstanding:
+                        other = (raw_response[0], raw_response[1])
+                        if other in self._outstanding and other not in self._early_responses:
+                            self._early_responses[other] = bytes(raw_response)
+                            stashed = True
+
+                    # app mainloop resets usb and sends empty device_id_response in case of error...
+                    # need to check for that specficially and give up; even if we've kept it for
+                    # a pending device info command.
+                    if raw_response[0] == 0x81 and raw_response[1] == 0x01 and raw_response[2] != 0:
+                        return None
+
+                    if stashed:
+                        continue
+
+                    mismatch_count += 1
+
+                # fw may respond with old data (e.g. if it's going through reset), so
+                # we resend cmd until a decently-related looking response comes back.
+                # fw could also be throwing us a lot of uart spew, which we want to skip
+                # without re-issuing the command for every unrelated report; so we only
+                # resend after a run of unrelated reports, or once we've gone a full
+                # resend interval without our response.
+                if mismatch_count >= self.COMMAND_RESEND_MISMATCH_LIMIT or \
+                        time.monotonic() - last_write_time >= self.COMMAND_RESEND_INTERVAL:
+                    self.usb_write(command)
+                    last_write_time = time.monotonic()
+                    mismatch_count  = 0
+
+            return self._parse_response(raw_response, response_length)
+
+        finally:
+            # Whether we got our response, gave up, or hit an error, it's no longer outstanding.
+            self._outstanding.pop(expected, None)
+
+
+    def _parse_response(self, raw_response, response_length):
+        """
+        Parses the response to a command, and reports any error status it carries.
+
+        raw_response -- The raw report containing the response.
+        response_length -- The length of the response data.
+
+        returns The response data.
+        """
+        resp = self.UsbResponse(raw_response, response_length)
 
         if resp.status != 0:
-            print('resp %02x:%02x error %x' % (resp.cmd_type, resp.cmd, resp.status))
+            log.warning("resp %02x:%02x error %x", resp.cmd_type, resp.cmd, resp.status)
 
         return resp.data
 
 
+    def send_command(self, command, response_length=USB_BUF_LEN):
+        """
+        Issue a command to the STM32 on the charging grip or pro controller.
+        Some commands (e.g. COMMAND_SEND_JOYCON_COMMAND) issue further commands to the JoyCon.
+
+        command -- The command to be issued.
+        response_length -- The length of the response to be read.
+
+        returns The response data.
+        """
+        data = self._send_command(command, response_length)
+        return None if data is None else bytes(data)
+
+
+    def _send_command(self, command, response_length=USB_BUF_LEN):
+        """
+        Issue a command to the STM32 on the charging grip or pro controller, without copying
+        its response out of our receive buffer.
+
+        command -- The command to be issued.
+        response_length -- The length of the response to be read.
+
+        returns A memoryview of the response data, which is only valid until the next read.
+        """
+        return self._await_response(self.post_command(command, response_length))
+
+
+    def send_commands_batched(self, commands):
+        """
+        Issues several commands to the STM32 at once, and then collects their responses.
+        Responses are matched to their commands by command number, so each command in a
+        batch must be distinct.
+
+        Commands that expect a response are re-issued if it's slow to arrive, while commands
+        that expect none are never re-issued. So the order of the batch is kept on the wire,
+        the responses to any commands already in flight are collected before a command that
+        expects no response is issued.
+
+        commands -- A list of (command, response_length) pairs to be issued.
+
+        returns A list of the commands' responses, in the same order as the commands.
+        """
+
+        # Figure out which response we expect for each command that has one.
+        expected = [(command[0] | 1, command[1]) for command, response_length in commands if response_length != 0]
+        if len(set(expected)) != len(expected):
+            raise ValueError("Each command in a batch must be distinct.")
+
+        responses = [None] * len(commands)
+        in_flight = []
+
+        for index, (command, response_length) in enumerate(commands):
+
+            # Don't let anything in flight be re-issued after a command that never will be.
+            if response_length == 0:
+                self._collect_batched_responses(in_flight, responses)
+
+            # Issue the raw command over USB, without waiting for its response yet.
+            in_flight.append((index, self.post_command(command, response_length)))
+
+        # Finally, collect any responses we're still waiting on.
+        self._collect_batched_responses(in_flight, responses)
+        return responses
+
+
+    def _collect_batched_responses(self, in_flight, responses):
+        """
+        Waits for the responses to a set of commands issued by send_commands_batched.
+
+        in_flight -- A list of (index, token) pairs for the commands in flight. Emptied once
+            their responses are collected.
+        responses -- The list of responses to populate, by index.
+        """
+        for index, token in in_flight:
+            data = self._await_response(token)
+
+            # Copy out the data, as we'll read the other responses over it.
+            responses[index] = None if data is None else bytes(data)
+
+        in_flight.clear()
+
+
     def read_device_info(self, raw=False): 
         """
         Reads the Charging Grip's current status.
         """
 
         # Read the device's info...
-        info = self.send_command(self.COMMAND_DEVICE_INFO, 8)
+        info = self._send_command(_COMMAND_DEVICE_INFO, 8)
 
         # If we've had a request for raw data, return it.
         if raw:
-            return info
+            return bytes(info)
 
         # Parse the data in the device info report... 
-        joycon_type = int.from_bytes(bytes(info[0:1]), byteorder='little')
-        mac         = int.from_bytes(bytes(info[1:7]), byteorder='little')
+        joycon_type, mac_low, mac_high = _DEVICE_INFO.unpack_from(info)
+        mac = mac_low | (mac_high << 32)
 
         # And compress things into a human-readable format.
         result = {
@@ -242,13 +528,13 @@ class USBSwitchController:
     def pair_via_uart(self): 
         """ Pairs the JoyCon to the charging grip via UART.  """
 
-        response = self.send_command(self.COMMAND_UART_PAIR)
+        response = self.send_command(_COMMAND_UART_PAIR)
         return response is not None
 
 
     def restrict_to_hid(self): 
         """ Instructs the JoyCon to communicate over HID instead of bluetooth. """
-        self.send_command(self.COMMAND_RESTRICT_TO_HID, 0)
+        self.send_command(_COMMAND_RESTRICT_TO_HID, 0)
 
 
     def reconnect(s, dev_id=None, delay=1):
@@ -261,10 +547,10 @@ class USBSwitchController:
 
         # FIXME: Don't use reconnect to connect to this; create a separate DFU object.
         if dev_id is None:
-            dev_id = self.device_id
+            dev_id = s.device_id
 
         time.sleep(delay)
-        s.connect_to_device(dev_id)
+        s.connect_to_device(*dev_id)
 
 
     def unlock_dfu():
@@ -283,14 +569,14 @@ class USBSwitchController:
         if self.lock_dfu_command:
             raise IOError("Entering DFU will erase the firmware from your controller; for safety, you'll need to unlock first.")
 
-        s.send_command(self.COMMAND_ENTER_DFU, 0)
+        s.send_command(_COMMAND_ENTER_DFU, 0)
         s.reacquire_device(self.DEVICE_ID_DFU)
 
 
     def reset(self):
         """ Resets the Charging Grip or pro Controller STM32 section. """
 
-        self.send_command(self.COMMAND_RESET, 0)
+        self.send_command(_COMMAND_RESET, 0)
         self.reconnect()
 
 
@@ -306,20 +592,26 @@ class USBSwitchController:
         returns The JoyCon's response.
         """
 
-        # Build the UART command header, which describes the raw JoyCon command to be issued.
-        command_header = struct.pack("<BHBBB", command, len(argument), 0, 0, 0)
+        packet_length = _UART_PACKET_HEADER.size + len(argument)
+        if packet_length > self.USB_BUF_LEN:
+            raise ValueError("UART command argument is too long to fit in a single packet.")
 
-        # And issue the wrapped command to the device.
+        # Build the UART command header, which describes the raw JoyCon command to be issued,
+        # wrapped in the grip's USB command; directly in our transmit buffer.
         # FIXME: this isn't right; this should be 80 command
-        packet       = bytes(self.COMMAND_SEND_UART_COMMAND) + command_header + argument
-        raw_response = self.send_command(packet)
+        _UART_PACKET_HEADER.pack_into(self._tx_buf, 0,
+                _COMMAND_SEND_UART_COMMAND, command, len(argument), 0, 0, 0)
+        self._tx_view[_UART_PACKET_HEADER.size:packet_length] = argument
+
+        # And issue the wrapped command to the device.
+        raw_response = self._send_command(self._tx_buf[:packet_length])
 
         # The response is led by 7 bytes of UART header, which we probably should check.
         # TODO: validate things here
 
         # The payload starts at byte 7, the eighth byte.
         response = raw_response[7:]
-        return response
+        return bytes(response)
 
 
     def send_bluetooth_command(self, command, subcommand, argument=b'', response_length=35):
@@ -335,16 +627,24 @@ class USBSwitchController:
         """
 
         # FIXME:  possibly move up to a UART abstraction module?
-        command    = command.to_bytes(1, byteorder='little')
-        rumble     = bytes([0x00, 0x00, 0x01, 0x40, 0x40, 0x00, 0x01, 0x40, 0x40])
-        subcommand = subcommand.to_bytes(1, byteorder='little')
+        packet_length = _BLUETOOTH_PACKET_HEADER.size + len(argument)
+        if packet_length > self.USB_BUF_LEN:
+            raise ValueError("Bluetooth command argument is too long to fit in a single packet.")
 
-        # Wrap the bluetooth command in a UART command header. The grip will further
+        # Wrap the bluetooth command in a UART command header, which is in turn wrapped in
+        # the grip's USB command; all directly in our transmit buffer. The grip will further
         # encapsulate it for transmission over real UART.
-        packet = command + rumble + subcommand + argument
-        raw_response = self.send_uart_command(self.UART_COMMAND_SEND_BT_CMD, packet) 
-
-        # The response is led by 15-bytes of input report. The payload starts at byte 10, the eleventh byte.
-        response = raw_response[15:15 + response_length]
-        return response
+        bluetooth_length = packet_length - _UART_PACKET_HEADER.size
+        _BLUETOOTH_PACKET_HEADER.pack_into(self._tx_buf, 0,
+                _COMMAND_SEND_UART_COMMAND,
+                self.UART_COMMAND_SEND_BT_CMD, bluetooth_length, 0, 0, 0,
+                command, _RUMBLE_NEUTRAL, subcommand)
+        self._tx_view[_BLUETOOTH_PACKET_HEADER.size:packet_length] = argument
+
+        raw_response = self._send_command(self._tx_buf[:packet_length])
+
+        # The response is led by 7 bytes of UART header, and then by 15-bytes of input report.
+        # The payload starts at byte 22, the twenty-third byte.
+        response = raw_response[22:22 + response_length]
+        return bytes(response)
 
@@ -18,4 +18,4 @@ right.pair_via_uart()
 # Claim the JoyCon, so it does not revert to Bluetooth.
 right.restrict_to_hid()
 
-print(right.send_bluetooth_command(0x01, 0x02, response_length=12).tostring())
+print(right.send_bluetooth_command(0x01, 0x02, response_length=12))